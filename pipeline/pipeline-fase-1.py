@@ -1,13 +1,36 @@
-import requests
-import datetime
+import aiohttp
+import asyncio
+import functools
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 import time
 from tqdm import tqdm
 
 # ===================== CONFIG =====================
 GITHUB_TOKEN = ""
-HEADERS = {"Authorization": f"Bearer {GITHUB_TOKEN}"}
+HEADERS = {"Authorization": f"Bearer {GITHUB_TOKEN}", "Content-Type": "application/json"}
 GRAPHQL_URL = "https://api.github.com/graphql"
+GITHUB_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
+REQUEST_TIMEOUT = 30
+MAX_CONNECTIONS = 8
+MAX_CONCURRENT_QUERIES = 5  # respeita o limite secundário do GitHub
+RATE_LIMIT_BUFFER = 100
+SECONDARY_RATE_LIMIT_WAIT = 60
+PARQUET_PATH = "dataset_fase1_validacao.parquet"
+CATEGORY_COLUMNS = ["Linguagem", "Data de morte", "Data de ressurreição"]
+RESULT_SCHEMA = pa.schema([
+    ("Nome", pa.string()),
+    ("Linguagem", pa.string()),
+    ("Stargazers", pa.int64()),
+    ("URL", pa.string()),
+    ("Data de morte", pa.string()),
+    ("Data de ressurreição", pa.string()),
+    ("Morreu após reviver", pa.int64()),
+    ("Commits analisados", pa.int64()),
+])
 
 # ===================== QUERIES =====================
 GRAPHQL_QUERY = """
@@ -38,37 +61,94 @@ query($queryString: String!) {
 """
 
 # ===================== FUNÇÕES =====================
-def run_query(query, variables):
+class RateLimiter:
+    """Espaça as requisições pelos cabeçalhos X-RateLimit-* em vez de pausas fixas."""
+
+    def __init__(self, buffer=RATE_LIMIT_BUFFER):
+        self.buffer = buffer
+        self.remaining = None
+        self.reset_at = 0.0
+
+    def update(self, headers):
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_at = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset_at is None:
+            return
+        self.remaining = int(remaining)
+        self.reset_at = float(reset_at)
+
+    def seconds_until_reset(self):
+        return max(self.reset_at - time.time() + 1, 0.0)
+
+    async def await_slot(self):
+        # Longe do limite segue sem pausa; perto dele, distribui o restante até o reset
+        if self.remaining is None or self.remaining >= self.buffer:
+            return
+        delay = self.seconds_until_reset() / max(self.remaining, 1)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+RATE_LIMITER = RateLimiter()
+
+
+@functools.lru_cache(maxsize=None)
+def query_prefix(query):
+    """Serializa uma única vez a parte estática do corpo (o documento GraphQL)."""
+    return b'{"query":' + orjson.dumps(query) + b',"variables":'
+
+
+async def run_query(session, semaphore, query, variables):
     """Executa query GraphQL com retry e tratamento de rate limit."""
+    payload = query_prefix(query) + orjson.dumps(variables) + b"}"
     for attempt in range(3):
-        r = requests.post(GRAPHQL_URL, json={"query": query, "variables": variables}, headers=HEADERS)
-        if r.status_code == 200:
-            data = r.json()
+        try:
+            async with semaphore:
+                await RATE_LIMITER.await_slot()
+                async with session.post(GRAPHQL_URL, data=payload) as r:
+                    status = r.status
+                    RATE_LIMITER.update(r.headers)
+                    if status == 200:
+                        data = orjson.loads(await r.read())
+                    else:
+                        text = await r.text()
+                        headers = r.headers
+        except (asyncio.TimeoutError, aiohttp.ClientError) as exc:
+            # Timeout (ClientTimeout) ou falha de conexão não pode derrubar o gather inteiro
+            print(f"⚠️ Falha de rede ({type(exc).__name__}) — retry em 5s...")
+            await asyncio.sleep(5)
+            continue
+        if status == 200:
             if "errors" in data:
                 print("⚠️ Erro na query:", data["errors"])
                 return None
             return data["data"]
-        elif r.status_code == 502:
+        elif status == 502:
             print("⚠️ Erro 502 — retry em 5s...")
-            time.sleep(5)
-        elif r.status_code == 403:
-            print("⏳ Rate limit atingido. Aguardando 60s...")
-            time.sleep(60)
+            await asyncio.sleep(5)
+        elif status == 403:
+            if headers.get("X-RateLimit-Remaining") == "0":
+                wait = RATE_LIMITER.seconds_until_reset()
+            else:
+                wait = float(headers.get("Retry-After", SECONDARY_RATE_LIMIT_WAIT))
+            print(f"⏳ Rate limit atingido. Aguardando {wait:.0f}s...")
+            await asyncio.sleep(wait)
         else:
-            print(f"❌ Erro {r.status_code}: {r.text[:150]}")
-            time.sleep(10)
+            print(f"❌ Erro {status}: {text[:150]}")
+            await asyncio.sleep(10)
     return None
 
 
 def detect_inactivity_periods(commit_dates, threshold_days=180):
-    """Retorna lista de períodos de inatividade (tuplas de início, fim)."""
-    commit_dates.sort()
-    periods = []
-    for i in range(1, len(commit_dates)):
-        delta = (commit_dates[i] - commit_dates[i - 1]).days
-        if delta >= threshold_days:
-            periods.append((commit_dates[i - 1], commit_dates[i]))
-    return periods
+    """Retorna lista de períodos de inatividade (tuplas de início, fim).
+
+    Aceita um array ``datetime64`` (ou datetimes naive) em UTC, pois ``datetime64`` não guarda fuso.
+    ``commit_dates`` deve estar ordenado de forma crescente; ``analyze_repo`` já o ordena.
+    """
+    arr = np.asarray(commit_dates, dtype="datetime64[s]")
+    deltas = np.diff(arr).astype("timedelta64[D]").astype(np.int64)
+    idx = np.nonzero(deltas >= threshold_days)[0]
+    return list(zip(arr[idx].tolist(), arr[idx + 1].tolist()))
 
 
 def analyze_repo(repo):
@@ -82,10 +162,8 @@ def analyze_repo(repo):
     if not commits:
         return None
 
-    commit_dates = [
-        datetime.datetime.fromisoformat(c["committedDate"].replace("Z", "+00:00"))
-        for c in commits if c.get("committedDate")
-    ]
+    raw = [c["committedDate"] for c in commits if c.get("committedDate")]
+    commit_dates = pd.to_datetime(raw, format=GITHUB_DATE_FORMAT, utc=True).tz_convert(None).to_numpy(copy=True)
     commit_dates.sort()
     inactivity_periods = detect_inactivity_periods(commit_dates)
     if not inactivity_periods:
@@ -93,7 +171,7 @@ def analyze_repo(repo):
 
     morte_dt, revive_dt = inactivity_periods[0]
     morreu_de_novo = 1 if len(inactivity_periods) > 1 else 0
-    has_commits_after_revive = any(c > revive_dt for c in commit_dates)
+    has_commits_after_revive = np.searchsorted(commit_dates, np.datetime64(revive_dt), side="right") < commit_dates.size
 
     return {
         "Nome": name,
@@ -107,8 +185,22 @@ def analyze_repo(repo):
     }
 
 
+async def fetch_all(queries):
+    """Dispara todas as buscas em paralelo, reaproveitando a mesma sessão HTTP."""
+    semaphore = asyncio.Semaphore(MAX_CONCURRENT_QUERIES)
+    connector = aiohttp.TCPConnector(limit=MAX_CONNECTIONS)
+    timeout = aiohttp.ClientTimeout(total=REQUEST_TIMEOUT)
+    async with aiohttp.ClientSession(headers=HEADERS, connector=connector, timeout=timeout) as session:
+        tasks = [
+            run_query(session, semaphore, GRAPHQL_QUERY, {"queryString": query_string})
+            for query_string in queries.values()
+        ]
+        results = await asyncio.gather(*tasks)
+    return dict(zip(queries.keys(), results))
+
+
 # ===================== MAIN PIPELINE =====================
-def main():
+async def main():
     print("🔍 Iniciando coleta — Fase 1: Validação limitada (1 token)")
 
     queries = {
@@ -118,7 +210,6 @@ def main():
         "Geral": "stars:5000..40000 created:2016-01-01..2019-12-31 sort:stars-desc"
     }
 
-    results_mortos, results_ressuscitados = [], []
     stats = {
         "Total coletados": 0,
         "Com commits válidos": 0,
@@ -127,38 +218,46 @@ def main():
         "Ressuscitados": 0,
     }
 
-    for lang, query_string in queries.items():
-        print(f"\n📦 Coletando {lang}...")
-        data = run_query(GRAPHQL_QUERY, {"queryString": query_string})
-        if not data:
-            print(f"⚠️ Nenhum dado retornado para {lang}.")
-            continue
+    print(f"\n📦 Coletando {', '.join(queries)}...")
+    responses = await fetch_all(queries)
+
+    # Cada lote é gravado no Parquet assim que analisado, sem acumular todos os resultados
+    with pq.ParquetWriter(PARQUET_PATH, RESULT_SCHEMA) as parquet_writer:
+        for lang, data in responses.items():
+            if not data:
+                print(f"⚠️ Nenhum dado retornado para {lang}.")
+                continue
+
+            repos = [edge["node"] for edge in data["search"]["edges"]]
+            stats["Total coletados"] += len(repos)
 
-        repos = [edge["node"] for edge in data["search"]["edges"]]
-        stats["Total coletados"] += len(repos)
+            batch_results = []
+            for repo in tqdm(repos, desc=f"🔄 Analisando {lang}", ncols=90):
+                try:
+                    analysis = analyze_repo(repo)
+                    if not analysis:
+                        continue
 
-        for repo in tqdm(repos, desc=f"🔄 Analisando {lang}", ncols=90):
-            try:
-                analysis = analyze_repo(repo)
-                if not analysis:
-                    continue
+                    stats["Com commits válidos"] += 1
+                    stats["Com períodos de inatividade"] += 1
 
-                stats["Com commits válidos"] += 1
-                stats["Com períodos de inatividade"] += 1
+                    batch_results.append(analysis)
+                    if analysis["Data de ressurreição"]:
+                        stats["Ressuscitados"] += 1
+                    else:
+                        stats["Mortos"] += 1
+                except Exception as e:
+                    print(f"⚠️ Erro analisando {repo.get('nameWithOwner')}: {e}")
 
-                if analysis["Data de ressurreição"]:
-                    results_ressuscitados.append(analysis)
-                    stats["Ressuscitados"] += 1
-                else:
-                    results_mortos.append(analysis)
-                    stats["Mortos"] += 1
-            except Exception as e:
-                print(f"⚠️ Erro analisando {repo.get('nameWithOwner')}: {e}")
-            time.sleep(1.2)
+            if batch_results:
+                parquet_writer.write_table(pa.Table.from_pylist(batch_results, schema=RESULT_SCHEMA))
 
     # Geração dos datasets
-    df_mortos = pd.DataFrame(results_mortos).drop_duplicates(subset=["Nome"])
-    df_ressuscitados = pd.DataFrame(results_ressuscitados).drop_duplicates(subset=["Nome"])
+    df = pd.read_parquet(PARQUET_PATH)
+    revived = df["Data de ressurreição"].notna()
+    categories = {col: "category" for col in CATEGORY_COLUMNS}
+    df_mortos = df[~revived].drop_duplicates(subset=["Nome"]).astype(categories)
+    df_ressuscitados = df[revived].drop_duplicates(subset=["Nome"]).astype(categories)
 
     # Estatísticas agregadas
     total_final = stats["Mortos"] + stats["Ressuscitados"]
@@ -179,8 +278,9 @@ def main():
         {"Métrica": "Taxa de aproveitamento (%)", "Valor": f"{taxa_aproveitamento:.2f}%"},
     ])
 
-    # Exportação para Excel com múltiplas abas
-    with pd.ExcelWriter("dataset_fase1_validacao.xlsx") as writer:
+    # Exportação para Excel com múltiplas abas via xlsxwriter (somente escrita, mais leve que openpyxl)
+    # Sem constant_memory: o pandas grava por coluna e esse modo descartaria as linhas anteriores
+    with pd.ExcelWriter("dataset_fase1_validacao.xlsx", engine="xlsxwriter") as writer:
         df_mortos.to_excel(writer, sheet_name="Mortos", index=False)
         df_ressuscitados.to_excel(writer, sheet_name="Ressuscitados", index=False)
         df_stats.to_excel(writer, sheet_name="Estatísticas", index=False)
@@ -189,7 +289,7 @@ def main():
     print(f"💀 Mortos: {len(df_mortos)}")
     print(f"✨ Ressuscitados: {len(df_ressuscitados)}")
     print(f"📈 Taxa de aproveitamento: {taxa_aproveitamento:.2f}%")
-    print("✅ Arquivo salvo em 'dataset_fase1_validacao.xlsx'.")
+    print(f"✅ Arquivos salvos em 'dataset_fase1_validacao.xlsx' e '{PARQUET_PATH}'.")
 
 if __name__ == "__main__":
-    main()
+    asyncio.run(main())
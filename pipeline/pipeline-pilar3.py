@@ -1,44 +1,66 @@
 import argparse
 import datetime as dt
-import json
+import functools
+import hashlib
 import os
 import subprocess
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, List, Mapping, NamedTuple, Optional, Tuple
 
+import orjson
 import pandas as pd
 import requests
+from diskcache import Cache
+from requests.adapters import HTTPAdapter
 from tqdm import tqdm
+from urllib3.util.retry import Retry
 
 GRAPHQL_URL = "https://api.github.com/graphql"
+GITHUB_DATE_FORMAT = "%Y-%m-%dT%H:%M:%SZ"
 REQUEST_TIMEOUT = 30
 RETRY_LIMIT = 3
+POOL_SIZE = 10
+RATE_LIMIT_BUFFER = 100
+SECONDARY_RATE_LIMIT_WAIT = 60
+LOG_TAIL_BYTES = 2000
+CACHE_TTL_SECONDS = 24 * 60 * 60
+# Colunas da planilha usadas no pipeline, renomeadas para identificadores validos em itertuples()
+ROW_FIELDS = {
+    "Nome": "nome",
+    "nameWithOwner": "name_with_owner",
+    "URL": "url",
+    "Data de morte": "data_morte",
+    "Data de ressurreição": "data_ressurreicao",
+}
 
-COMMITS_WINDOW_QUERY = """
-query($owner: String!, $name: String!, $first: Int!, $since: GitTimestamp, $until: GitTimestamp) {
-  repository(owner: $owner, name: $name) {
-    nameWithOwner
-    defaultBranchRef {
-      name
-      target {
-        ... on Commit {
-          history(first: $first, since: $since, until: $until) {
-            nodes {
-              oid
-              committedDate
-              messageHeadline
-            }
-          }
-        }
-      }
-    }
-  }
+BATCH_SIZE = 20
+HISTORY_PAGE_SIZE = 100
+PRE_DEATH_WINDOW_DAYS = 730
+POST_REVIVE_WINDOWS = [30, 90, 180, 365, 730]
+
+COMMIT_FIELDS_FRAGMENT = """
+fragment CommitFields on Commit {
+  oid
+  committedDate
+  messageHeadline
 }
 """
 
+HISTORY_SELECTION = """
+    {alias}: defaultBranchRef {{
+      target {{
+        ... on Commit {{
+          history(first: $first, since: ${since_var}, until: ${until_var}) {{
+            nodes {{ ...CommitFields }}
+          }}
+        }}
+      }}
+    }}"""
+
 
 @dataclass
 class SnapshotCommit:
@@ -47,10 +69,52 @@ class SnapshotCommit:
     message: str
 
 
+@dataclass
+class RepoTarget:
+    full_name: str
+    owner: str
+    name: str
+    url: str
+    death: dt.datetime
+    revive: dt.datetime
+
+
 class PipelineError(Exception):
     pass
 
 
+class RateLimiter:
+    """Espaca as requisicoes pelos cabecalhos X-RateLimit-* em vez de pausas fixas."""
+
+    def __init__(self, buffer: int = RATE_LIMIT_BUFFER) -> None:
+        self.buffer = buffer
+        self.remaining: Optional[int] = None
+        self.reset_at = 0.0
+
+    def update(self, headers: Mapping[str, str]) -> None:
+        remaining = headers.get("X-RateLimit-Remaining")
+        reset_at = headers.get("X-RateLimit-Reset")
+        if remaining is None or reset_at is None:
+            return
+        self.remaining = int(remaining)
+        self.reset_at = float(reset_at)
+
+    def seconds_until_reset(self) -> float:
+        return max(self.reset_at - time.time() + 1, 0.0)
+
+    def wait_slot(self) -> None:
+        # Longe do limite as requisicoes seguem sem pausa; perto dele, distribui o restante ate o reset
+        if self.remaining is None or self.remaining >= self.buffer:
+            return
+        delay = self.seconds_until_reset() / max(self.remaining, 1)
+        if delay > 0:
+            time.sleep(delay)
+
+
+RATE_LIMITER = RateLimiter()
+
+
+@functools.lru_cache(maxsize=8192)
 def utc_from_str(date_str: str) -> dt.datetime:
     return dt.datetime.fromisoformat(date_str.replace("Z", "+00:00")).astimezone(dt.timezone.utc)
 
@@ -61,111 +125,199 @@ def to_iso8601(ts: dt.datetime) -> str:
     return ts.astimezone(dt.timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
 
 
-def run_query(query: str, variables: Dict[str, object], headers: Dict[str, str]) -> Optional[Dict[str, object]]:
+def build_session(github_token: str) -> requests.Session:
+    """Sessao HTTP persistente: reaproveita conexoes TLS e repete erros 5xx transitorios."""
+    session = requests.Session()
+    session.headers.update({"Authorization": f"Bearer {github_token}", "Content-Type": "application/json"})
+    retry = Retry(
+        total=RETRY_LIMIT,
+        backoff_factor=1,
+        status_forcelist=[502, 503, 504],
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False,
+    )
+    session.mount("https://", HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE, max_retries=retry))
+    return session
+
+
+@functools.lru_cache(maxsize=32)
+def query_prefix(query: str) -> bytes:
+    # A parte estatica do corpo (o documento GraphQL) e serializada uma unica vez
+    return b'{"query":' + orjson.dumps(query) + b',"variables":'
+
+
+def encode_payload(query: str, variables: Dict[str, object]) -> bytes:
+    return query_prefix(query) + orjson.dumps(variables) + b"}"
+
+
+def run_query(
+    query: str,
+    variables: Dict[str, object],
+    session: requests.Session,
+) -> Optional[Dict[str, object]]:
+    body = encode_payload(query, variables)
     for attempt in range(1, RETRY_LIMIT + 1):
-        response = requests.post(
+        RATE_LIMITER.wait_slot()
+        response = session.post(
             GRAPHQL_URL,
-            json={"query": query, "variables": variables},
-            headers=headers,
+            data=body,
             timeout=REQUEST_TIMEOUT,
         )
+        RATE_LIMITER.update(response.headers)
         if response.status_code == 200:
-            payload = response.json()
+            payload = orjson.loads(response.content)
             if "errors" in payload:
+                # Consultas em lote retornam dados parciais quando apenas alguns repositorios falham
                 messages = ", ".join(err.get("message", "unknown error") for err in payload["errors"])
                 print(f"[warn] GraphQL error: {messages}")
-                return None
             return payload.get("data")
-        if response.status_code == 502:
-            print("[warn] GraphQL 502, retrying in 5 seconds...")
-            time.sleep(5)
-            continue
         if response.status_code == 403:
-            print("[info] GraphQL rate limit hit, waiting 60 seconds...")
-            time.sleep(60)
+            if response.headers.get("X-RateLimit-Remaining") == "0":
+                wait = RATE_LIMITER.seconds_until_reset()
+            else:
+                wait = float(response.headers.get("Retry-After", SECONDARY_RATE_LIMIT_WAIT))
+            print(f"[info] GraphQL rate limit hit, waiting {wait:.0f} seconds...")
+            time.sleep(wait)
             continue
         print(f"[error] GraphQL request failed (status {response.status_code}): {response.text[:200]}")
         time.sleep(10)
     return None
 
 
-def fetch_commits(
-    owner: str,
-    name: str,
-    since: Optional[dt.datetime],
-    until: Optional[dt.datetime],
-    headers: Dict[str, str],
-    first: int = 100,
-) -> List[Dict[str, str]]:
-    variables: Dict[str, object] = {"owner": owner, "name": name, "first": first}
-    if since is not None:
-        variables["since"] = to_iso8601(since)
-    if until is not None:
-        variables["until"] = to_iso8601(until)
-    data = run_query(COMMITS_WINDOW_QUERY, variables, headers)
-    if not data:
-        return []
-    repo = data.get("repository")
-    if not repo or not repo.get("defaultBranchRef"):
+def window_timestamps(target: RepoTarget) -> Dict[str, str]:
+    """Limites (since/until) das janelas pre-morte e pos-revive de um repositorio."""
+    timestamps = {
+        "s_pre": target.death - dt.timedelta(days=PRE_DEATH_WINDOW_DAYS),
+        "u_pre": target.death + dt.timedelta(days=1),
+        "s_post": target.revive,
+    }
+    for days in POST_REVIVE_WINDOWS:
+        timestamps[f"u_post{days}"] = target.revive + dt.timedelta(days=days)
+    return {name: to_iso8601(ts) for name, ts in timestamps.items()}
+
+
+def build_windows_query(targets: List[RepoTarget]) -> Tuple[str, Dict[str, object]]:
+    """Monta um unico documento GraphQL com as janelas pre-morte e pos-revive de cada repositorio."""
+    declarations = ["$first: Int!"]
+    selections: List[str] = []
+    variables: Dict[str, object] = {"first": HISTORY_PAGE_SIZE}
+    for index, target in enumerate(targets):
+        declarations.extend([f"$o{index}: String!", f"$n{index}: String!"])
+        variables[f"o{index}"] = target.owner
+        variables[f"n{index}"] = target.name
+
+        histories = [HISTORY_SELECTION.format(alias="pre", since_var=f"s_pre_{index}", until_var=f"u_pre_{index}")]
+        for days in POST_REVIVE_WINDOWS:
+            histories.append(
+                HISTORY_SELECTION.format(alias=f"post{days}", since_var=f"s_post_{index}", until_var=f"u_post{days}_{index}")
+            )
+        for var_name, value in window_timestamps(target).items():
+            declarations.append(f"${var_name}_{index}: GitTimestamp")
+            variables[f"{var_name}_{index}"] = value
+        selections.append(f"  r{index}: repository(owner: $o{index}, name: $n{index}) {{{''.join(histories)}\n  }}")
+
+    query = f"query({', '.join(declarations)}) {{\n" + "\n".join(selections) + "\n}\n" + COMMIT_FIELDS_FRAGMENT
+    return query, variables
+
+
+def history_nodes(branch_ref: Optional[Dict[str, object]]) -> List[Dict[str, str]]:
+    if not branch_ref:
         return []
-    target = repo["defaultBranchRef"].get("target") or {}
+    target = branch_ref.get("target") or {}
     history = target.get("history") or {}
     return history.get("nodes", [])
 
 
+def window_cache_key(target: RepoTarget) -> str:
+    # Chave por repositorio: (owner, name, limites das janelas, first), independente do lote
+    parts = {"owner": target.owner, "name": target.name, "first": HISTORY_PAGE_SIZE, **window_timestamps(target)}
+    return hashlib.blake2b(orjson.dumps(parts, option=orjson.OPT_SORT_KEYS)).hexdigest()
+
+
+def window_cache_expire(target: RepoTarget) -> Optional[float]:
+    # Historico com limite superior no passado nao muda mais; so janelas abertas expiram
+    latest_until = target.revive + dt.timedelta(days=max(POST_REVIVE_WINDOWS))
+    return None if latest_until < dt.datetime.now(dt.timezone.utc) else CACHE_TTL_SECONDS
+
+
+def cached_commit_windows(
+    targets: List[RepoTarget],
+    cache: Cache,
+) -> Tuple[Dict[str, Dict[str, List[Dict[str, str]]]], List[RepoTarget]]:
+    """Separa os repositorios ja em cache dos que ainda precisam ser buscados."""
+    windows: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+    pending: List[RepoTarget] = []
+    for target in targets:
+        cached = cache.get(window_cache_key(target))
+        if cached is not None:
+            windows[target.full_name] = cached
+        else:
+            pending.append(target)
+    return windows, pending
+
+
+def fetch_commit_windows(
+    targets: List[RepoTarget],
+    session: requests.Session,
+    cache: Optional[Cache] = None,
+) -> Dict[str, Dict[str, List[Dict[str, str]]]]:
+    """Busca as janelas de commits de varios repositorios em uma unica requisicao."""
+    query, variables = build_windows_query(targets)
+    data = run_query(query, variables, session) or {}
+    windows: Dict[str, Dict[str, List[Dict[str, str]]]] = {}
+    for index, target in enumerate(targets):
+        repo = data.get(f"r{index}")
+        if not repo:
+            # Repositorio inexistente (ou erro) nao entra no cache e e tentado de novo na proxima execucao
+            continue
+        aliases = ["pre"] + [f"post{days}" for days in POST_REVIVE_WINDOWS]
+        windows[target.full_name] = {alias: history_nodes(repo.get(alias)) for alias in aliases}
+        if cache is not None:
+            cache.set(window_cache_key(target), windows[target.full_name], expire=window_cache_expire(target))
+    return windows
+
+
 def pick_pre_death_commit(
-    owner: str,
-    name: str,
+    commits: List[Dict[str, str]],
     death_date: dt.datetime,
-    headers: Dict[str, str],
 ) -> Optional[SnapshotCommit]:
-    search_windows = [90, 180, 365, 730]
     end_boundary = death_date + dt.timedelta(days=1)
-    for window in search_windows:
-        since = death_date - dt.timedelta(days=window)
-        commits = fetch_commits(owner, name, since, end_boundary, headers)
-        if not commits:
-            continue
-        parsed: List[SnapshotCommit] = []
-        for node in commits:
-            committed_at = utc_from_str(node["committedDate"])
-            if committed_at <= end_boundary:
-                parsed.append(
-                    SnapshotCommit(
-                        sha=node["oid"],
-                        committed_at=committed_at,
-                        message=node.get("messageHeadline", ""),
-                    )
+    parsed: List[SnapshotCommit] = []
+    for node in commits:
+        committed_at = utc_from_str(node["committedDate"])
+        if committed_at <= end_boundary:
+            parsed.append(
+                SnapshotCommit(
+                    sha=node["oid"],
+                    committed_at=committed_at,
+                    message=node.get("messageHeadline", ""),
                 )
-        if parsed:
-            parsed.sort(key=lambda c: c.committed_at, reverse=True)
-            return parsed[0]
+            )
+    if parsed:
+        parsed.sort(key=lambda c: c.committed_at, reverse=True)
+        return parsed[0]
     return None
 
 
 def pick_post_revive_commit(
-    owner: str,
-    name: str,
+    windows: List[List[Dict[str, str]]],
     revive_date: dt.datetime,
-    headers: Dict[str, str],
 ) -> Optional[SnapshotCommit]:
-    search_windows = [30, 90, 180, 365, 730]
+    # As janelas crescentes chegam na mesma resposta; percorre-las em ordem preserva
+    # a escolha do decimo commit mesmo quando a maior janela passa de 100 commits.
     collected: Dict[str, SnapshotCommit] = {}
-    for window in search_windows:
-        since = revive_date
-        until = revive_date + dt.timedelta(days=window)
-        commits = fetch_commits(owner, name, since, until, headers)
-        if not commits:
+    for commits in windows:
+        nodes = [node for node in commits if node.get("committedDate") and node.get("oid")]
+        if not nodes:
             continue
-        for node in commits:
-            commit_date_raw = node.get("committedDate")
-            if not commit_date_raw:
-                continue
-            committed_at = utc_from_str(commit_date_raw)
+        parsed_dates = pd.to_datetime(
+            [node["committedDate"] for node in nodes],
+            format=GITHUB_DATE_FORMAT,
+            utc=True,
+        ).to_pydatetime()
+        for node, committed_at in zip(nodes, parsed_dates):
             if committed_at >= revive_date:
-                sha = node.get("oid")
-                if not sha:
-                    continue
+                sha = node["oid"]
                 collected[sha] = SnapshotCommit(
                     sha=sha,
                     committed_at=committed_at,
@@ -181,17 +333,53 @@ def ensure_git_clone(repo_url: str, destination: Path) -> None:
     if destination.exists():
         return
     destination.parent.mkdir(parents=True, exist_ok=True)
-    subprocess.run(["git", "clone", "--quiet", repo_url, str(destination)], check=True)
+    # Clone bare, parcial e raso: so o commit da ponta e suas arvores, sem blobs
+    subprocess.run(
+        ["git", "clone", "--quiet", "--bare", "--filter=blob:none", "--depth=1", repo_url, str(destination)],
+        check=True,
+    )
+
+
+def fetch_snapshot_commits(repo_path: Path, commit_shas: List[str]) -> None:
+    # Traz apenas os commits dos snapshots; o checkout baixa somente os blobs das suas arvores
+    subprocess.run(["git", "fetch", "--quiet", "--depth=1", "origin", *commit_shas], cwd=repo_path, check=True)
+
+
+def read_head(repo_path: Path) -> Optional[str]:
+    """Le o HEAD destacado direto do disco, sem abrir um processo git."""
+    git_path = repo_path / ".git"
+    try:
+        if git_path.is_file():
+            # Em worktrees o .git e um arquivo "gitdir: <caminho>" apontando para os metadados
+            git_path = repo_path / git_path.read_text(encoding="utf-8").split("gitdir:", 1)[1].strip()
+        head = (git_path / "HEAD").read_text(encoding="utf-8").strip()
+    except (OSError, IndexError):
+        return None
+    return None if head.startswith("ref:") else head
 
 
 def checkout_commit(repo_path: Path, commit_sha: str) -> None:
+    # O commit ja foi buscado no clone compartilhado; aqui nao ha fetch, que disputaria o shallow.lock
+    if read_head(repo_path) == commit_sha:
+        return
     subprocess.run(["git", "checkout", "--quiet", commit_sha], cwd=repo_path, check=True)
 
 
-def clone_snapshot(repo_url: str, commit_sha: str, target_dir: Path) -> None:
-    if not target_dir.exists():
-        ensure_git_clone(repo_url, target_dir)
-    checkout_commit(target_dir, commit_sha)
+def clone_snapshot(shared_dir: Path, commit_sha: str, target_dir: Path) -> None:
+    if target_dir.exists():
+        checkout_commit(target_dir, commit_sha)
+        return
+    subprocess.run(
+        ["git", "worktree", "add", "--quiet", "--force", "--detach", str(target_dir), commit_sha],
+        cwd=shared_dir,
+        check=True,
+    )
+
+
+def read_tail(path: Path, size: int = LOG_TAIL_BYTES) -> str:
+    with path.open("rb") as fp:
+        fp.seek(max(path.stat().st_size - size, 0))
+        return fp.read().decode("utf-8", errors="replace")
 
 
 def run_pysonar(
@@ -204,6 +392,8 @@ def run_pysonar(
 ) -> Dict[str, object]:
     report_dir.mkdir(parents=True, exist_ok=True)
     report_path = report_dir / f"{branch_label}.json"
+    stdout_path = report_dir / f"{branch_label}.stdout.log"
+    stderr_path = report_dir / f"{branch_label}.stderr.log"
     cmd = [
         "pysonar",
         f"--sonar-token={sonar_token}",
@@ -212,7 +402,9 @@ def run_pysonar(
         f"--sonar-project-base-dir={str(snapshot_dir)}",
     ]
     try:
-        completed = subprocess.run(cmd, capture_output=True, text=True, check=False)
+        # Os logs vao direto para disco; so o final de cada um e lido de volta para o resumo
+        with stdout_path.open("wb") as out, stderr_path.open("wb") as err:
+            completed = subprocess.run(cmd, stdout=out, stderr=err, check=False)
     except FileNotFoundError as exc:
         return {
             "status": "error",
@@ -224,20 +416,51 @@ def run_pysonar(
     return {
         "status": status,
         "exit_code": completed.returncode,
-        "stdout": completed.stdout[-2000:],
-        "stderr": completed.stderr[-2000:],
+        "stdout": read_tail(stdout_path),
+        "stderr": read_tail(stderr_path),
+        "stdout_log": str(stdout_path),
+        "stderr_log": str(stderr_path),
         "report_path": str(report_path) if report_path.exists() else None,
     }
 
 
+def analyze_repo_snapshots(
+    snapshots: List[Dict[str, object]],
+    sonar_token: str,
+    organization: str,
+    reports_root: Path,
+) -> List[Dict[str, object]]:
+    """Analisa em sequencia os snapshots de um repositorio, para que o pos-revive seja a analise mais recente."""
+    results: List[Dict[str, object]] = []
+    for snapshot in snapshots:
+        report = run_pysonar(
+            Path(str(snapshot["path"])),
+            sonar_token,
+            project_key_for(str(snapshot["repo"])),
+            organization,
+            str(snapshot["branch_label"]),
+            reports_root,
+        )
+        snapshot_result = dict(snapshot)
+        snapshot_result["report"] = report
+        results.append(snapshot_result)
+    return results
+
+
+@functools.lru_cache(maxsize=4096)
 def sanitize_branch_name(value: str) -> str:
     allowed = [c if c.isalnum() or c in "-_" else "-" for c in value]
     return "".join(allowed)[:100] or "snapshot"
 
 
-def parse_dates(row: pd.Series) -> Dict[str, dt.datetime]:
-    morte_str = str(row.get("Data de morte", "")).strip()
-    revive_str = str(row.get("Data de ressurreição", "")).strip()
+@functools.lru_cache(maxsize=4096)
+def project_key_for(repo_full_name: str) -> str:
+    return repo_full_name.replace("/", "_").replace(".", "-")
+
+
+def parse_dates(row: NamedTuple) -> Dict[str, dt.datetime]:
+    morte_str = str(getattr(row, "data_morte", "")).strip()
+    revive_str = str(getattr(row, "data_ressurreicao", "")).strip()
     if not revive_str:
         raise PipelineError("Linha sem data de ressurreição válida")
     try:
@@ -255,35 +478,60 @@ def parse_dates(row: pd.Series) -> Dict[str, dt.datetime]:
     return {"death": death_date, "revive": revive_date}
 
 
-def prepare_snapshots(
-    row: pd.Series,
-    headers: Dict[str, str],
-    snapshots_root: Path,
-) -> List[Dict[str, object]]:
-    repo_full_name = row.get("Nome") or row.get("nameWithOwner")
+def build_target(row: NamedTuple) -> RepoTarget:
+    repo_full_name = getattr(row, "nome", None) or getattr(row, "name_with_owner", None)
     if not repo_full_name or "/" not in repo_full_name:
         raise PipelineError("Nome do repositório inválido")
     owner, name = repo_full_name.split("/", 1)
-    repo_url = row.get("URL")
+    repo_url = getattr(row, "url", None)
     if not repo_url:
         repo_url = f"https://github.com/{owner}/{name}"
     dates = parse_dates(row)
-    pre_commit = pick_pre_death_commit(owner, name, dates["death"], headers)
+    return RepoTarget(
+        full_name=repo_full_name,
+        owner=owner,
+        name=name,
+        url=repo_url,
+        death=dates["death"],
+        revive=dates["revive"],
+    )
+
+
+def prepare_snapshots(
+    target: RepoTarget,
+    windows: Dict[str, List[Dict[str, str]]],
+    snapshots_root: Path,
+) -> List[Dict[str, object]]:
+    repo_full_name, owner, name, repo_url = target.full_name, target.owner, target.name, target.url
+    pre_commit = pick_pre_death_commit(windows.get("pre", []), target.death)
     if not pre_commit:
         raise PipelineError("Não foi possível localizar commit pré-morte")
-    post_commit = pick_post_revive_commit(owner, name, dates["revive"], headers)
+    post_windows = [windows.get(f"post{days}", []) for days in POST_REVIVE_WINDOWS]
+    post_commit = pick_post_revive_commit(post_windows, target.revive)
     if not post_commit:
         raise PipelineError("Repositorio sem ao menos dez commits apos a ressurreição")
 
     base_dir = snapshots_root / f"{owner}__{name}"
+    shared_dir = base_dir / ".git_shared"
     pre_dir = base_dir / "pre_morte"
     post_dir = base_dir / "pos_revive"
 
-    clone_snapshot(repo_url, pre_commit.sha, pre_dir)
-    checkout_commit(pre_dir, pre_commit.sha)
-
-    clone_snapshot(repo_url, post_commit.sha, post_dir)
-    checkout_commit(post_dir, post_commit.sha)
+    # Um unico clone compartilhado; cada snapshot e um worktree sobre o mesmo banco de objetos.
+    # Todos os commits que faltam sao buscados numa so chamada, antes dos checkouts em paralelo.
+    snapshots = ((pre_commit, pre_dir), (post_commit, post_dir))
+    missing = [commit.sha for commit, path in snapshots if read_head(path) != commit.sha]
+    if missing:
+        ensure_git_clone(repo_url, shared_dir)
+        fetch_snapshot_commits(shared_dir, missing)
+
+    # Os checkouts dos dois worktrees sao independentes; o git roda fora do GIL
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        clones = [
+            executor.submit(clone_snapshot, shared_dir, pre_commit.sha, pre_dir),
+            executor.submit(clone_snapshot, shared_dir, post_commit.sha, post_dir),
+        ]
+        for clone in clones:
+            clone.result()
 
     pre_branch = sanitize_branch_name(f"{owner}-{name}-pre")
     post_branch = sanitize_branch_name(f"{owner}-{name}-post")
@@ -326,6 +574,12 @@ def main() -> None:
     parser.add_argument("--sonar-token", type=str, default=os.getenv("SONAR_TOKEN"), help="Token para autenticacao Sonar")
     parser.add_argument("--sonar-organization", type=str, default=os.getenv("SONAR_ORGANIZATION", "ti6"))
     parser.add_argument("--limit", type=int, default=None, help="Limite opcional de repositorios a processar")
+    parser.add_argument(
+        "--sonar-workers",
+        type=int,
+        default=min(8, os.cpu_count() or 1),
+        help="Quantidade de analises pysonar executadas em paralelo",
+    )
     args = parser.parse_args()
 
     if not args.github_token:
@@ -335,7 +589,7 @@ def main() -> None:
         print("[error] Forneca o token do Sonar via --sonar-token ou variavel SONAR_TOKEN.")
         sys.exit(1)
 
-    headers = {"Authorization": f"Bearer {args.github_token}"}
+    session = build_session(args.github_token)
     excel_path = Path(args.excel_path).resolve()
     if not excel_path.exists():
         print(f"[error] Arquivo nao encontrado: {excel_path}")
@@ -351,22 +605,34 @@ def main() -> None:
         print(f"[error] {exc}")
         sys.exit(1)
 
-    snapshot_records: List[Dict[str, object]] = []
-    records: List[Dict[str, object]] = df.to_dict(orient="records")
+    rows = df[[column for column in ROW_FIELDS if column in df.columns]].rename(columns=ROW_FIELDS)
     if args.limit:
-        records = records[: args.limit]
-    for row_dict in tqdm(records, desc="Preparando snapshots", unit="repo"):
-        row_series = pd.Series(row_dict)
+        rows = rows.head(args.limit)
+    targets: List[RepoTarget] = []
+    for row in rows.itertuples(index=False, name="Row"):
+        try:
+            targets.append(build_target(row))
+        except PipelineError as exc:
+            repo_name = getattr(row, "nome", None) or getattr(row, "name_with_owner", None) or "desconhecido"
+            print(f"[warn] Falha ao processar {repo_name}: {exc}")
+
+    with Cache(str(output_root / ".ghcache")) as cache:
+        # Apenas os repositorios fora do cache sao agrupados nos lotes enviados ao GitHub
+        commit_windows, pending = cached_commit_windows(targets, cache)
+        for start in tqdm(range(0, len(pending), BATCH_SIZE), desc="Buscando commits", unit="lote"):
+            commit_windows.update(fetch_commit_windows(pending[start : start + BATCH_SIZE], session, cache))
+
+    snapshot_records: List[Dict[str, object]] = []
+    for target in tqdm(targets, desc="Preparando snapshots", unit="repo"):
         try:
             row_snapshots = prepare_snapshots(
-                row_series,
-                headers,
+                target,
+                commit_windows.get(target.full_name, {}),
                 snapshots_root,
             )
             snapshot_records.extend(row_snapshots)
         except (PipelineError, subprocess.CalledProcessError) as exc:
-            repo_name = row_series.get("Nome") or row_series.get("nameWithOwner") or "desconhecido"
-            print(f"[warn] Falha ao processar {repo_name}: {exc}")
+            print(f"[warn] Falha ao processar {target.full_name}: {exc}")
 
     if not snapshot_records:
         print("[warn] Nenhum snapshot preparado.")
@@ -389,29 +655,31 @@ def main() -> None:
     #                 "branch_label": f"{repo_dir.name.replace('__', '-')}-{snap_type}",
     #             })
 
-    results: List[Dict[str, object]] = []
-    for snapshot in tqdm(snapshot_records, desc="Analisando snapshots", unit="snapshot"):
-        snapshot_path = Path(str(snapshot["path"]))
-        
-        repo_full_name = str(snapshot["repo"])
-        project_key = repo_full_name.replace("/", "_").replace(".", "-")
-
-        report = run_pysonar(
-            snapshot_path,
-            args.sonar_token,
-            project_key,
-            args.sonar_organization,
-            str(snapshot["branch_label"]),
-            reports_root,
-        )
-        snapshot_result = dict(snapshot)
-        snapshot_result["report"] = report
-        results.append(snapshot_result)
+    # Snapshots do mesmo repositorio compartilham o projeto Sonar: ficam juntos, na ordem pre -> pos
+    indices_by_repo: Dict[str, List[int]] = {}
+    for index, snapshot in enumerate(snapshot_records):
+        indices_by_repo.setdefault(str(snapshot["repo"]), []).append(index)
+
+    results: List[Optional[Dict[str, object]]] = [None] * len(snapshot_records)
+    # Paraleliza entre repositorios; o tamanho do pool limita as chamadas simultaneas ao Sonar
+    with ThreadPoolExecutor(max_workers=max(1, args.sonar_workers)) as executor:
+        futures = {
+            executor.submit(
+                analyze_repo_snapshots,
+                [snapshot_records[index] for index in indices],
+                args.sonar_token,
+                args.sonar_organization,
+                reports_root,
+            ): indices
+            for indices in indices_by_repo.values()
+        }
+        for future in tqdm(as_completed(futures), total=len(futures), desc="Analisando snapshots", unit="repo"):
+            for index, snapshot_result in zip(futures[future], future.result()):
+                results[index] = snapshot_result
 
     summary_path = output_root / "resumo_pilar3.json"
     output_root.mkdir(parents=True, exist_ok=True)
-    with summary_path.open("w", encoding="utf-8") as fp:
-        json.dump(results, fp, ensure_ascii=False, indent=2)
+    summary_path.write_bytes(orjson.dumps(results, option=orjson.OPT_INDENT_2))
     print(f"[info] Resumo salvo em {summary_path}")
 
 